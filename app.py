@@ -1,61 +1,273 @@
 # app.py (Final version with Database)
 
 import os
-import json
 import re
+import logging
+import hashlib
 import math
 import sqlite3 # Built-in library for SQLite
+import threading
+import queue
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orjson # Fast JSON (de)serialization in native code
 import google.generativeai as genai
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, make_response
+from flask.json.provider import JSONProvider
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Local testing fallback: set DISABLE_AI=1 (or true) in your environment to avoid calling the external API.
+# Read once at startup; restart the server after changing it.
+_DISABLE_AI = os.environ.get('DISABLE_AI', '').lower() in ('1', 'true', 'yes')
+# Limits on untrusted sizes: goals longer than this are rejected before reaching the model,
+# and model output beyond this many characters is dropped before it is cleaned up and parsed.
+MAX_GOAL_LENGTH = 4096
+MAX_RESPONSE_LENGTH = 1_000_000
+# Most goals accepted by one /create-plans request (each one can cost a model call)
+MAX_BATCH_GOALS = 20
+# Set LOG_RAW=1 to log every raw model response (can be several KB per request)
+_LOG_RAW = os.environ.get('LOG_RAW', '').lower() in ('1', 'true', 'yes')
+
+class OrjsonProvider(JSONProvider):
+    # Route jsonify() and request.get_json() through orjson instead of the stdlib json module
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+if _LOG_RAW:
+    app.logger.setLevel(logging.DEBUG)
+
+# Patterns used to clean up the model output and parse quota errors.
+# Compiled once at import time instead of on every request.
+_FENCE_PREFIX_RE = re.compile(r"^```(?:json)?\s*", re.IGNORECASE)
+# Matches either "Please retry in 12.3s" or "retry_delay { seconds: 12 }" in a single scan
+_RETRY_RE = re.compile(
+    r'Please retry in\s*(\d+(?:\.\d+)?)s|retry_delay\s*\{[^}]*seconds:\s*(\d+)',
+    re.IGNORECASE,
+)
 
 # --- NEW: Database Setup ---
 def init_db():
     # Establishes a connection to the database file (creates it if it doesn't exist)
     conn = sqlite3.connect('plans.db')
     cursor = conn.cursor()
+    # WAL lets readers run alongside the writer and commits with a single fsync.
+    # journal_mode is persistent in the database file; synchronous is per connection.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
     # Creates a 'plans' table if it doesn't already exist
-    # We store the plan_data as a JSON text string
+    # We store the plan_data as UTF-8 encoded JSON bytes (older rows may still hold TEXT)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS plans (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             project_name TEXT NOT NULL,
-            plan_data TEXT NOT NULL,
+            plan_data BLOB NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # Older databases were created before goal_hash existed, so add the column when missing
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(plans)")]
+    if 'goal_hash' not in columns:
+        cursor.execute("ALTER TABLE plans ADD COLUMN goal_hash TEXT")
+    # Index backing the newest-first, keyset-paginated listing on /plans. It includes id so
+    # the (created_at, id) cursor is a range seek with no extra sort; it replaces the older
+    # created_at-only index.
+    cursor.execute("DROP INDEX IF EXISTS idx_plans_created")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_plans_created_id ON plans(created_at DESC, id DESC)")
+    # One saved plan per (normalized) goal, used to skip repeat model calls
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_plans_goal_hash ON plans(goal_hash)")
     conn.commit()
     conn.close()
 
+# Each worker thread keeps one open connection and reuses it across requests,
+# instead of paying the connect/setup cost on every call.
+_tls = threading.local()
+
+def get_conn():
+    conn = getattr(_tls, 'conn', None)
+    if conn is None:
+        # Autocommit mode: every statement commits on its own unless wrapped in `with conn:`
+        conn = sqlite3.connect('plans.db', check_same_thread=False, isolation_level=None)
+        # Use a dictionary cursor to get column names
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _tls.conn = conn
+    return conn
+
+# --- Write-behind queue for saving plans ---
+# Endpoints hand rows to a background writer and respond straight away; the writer drains
+# whatever has accumulated (up to _WRITE_BATCH_SIZE rows) and commits it in one transaction.
+_WRITE_BATCH_SIZE = 32
+# Kept as one constant string so the writer's long-lived connection parses it once and
+# reuses the prepared statement from sqlite3's per-connection statement cache.
+# Only a duplicate goal_hash (a plan for that goal is already saved) is skipped; any other
+# constraint failure still raises and is reported as a save error.
+INSERT_SQL = (
+    "INSERT INTO plans (project_name, plan_data, goal_hash) VALUES (?, ?, ?)"
+    " ON CONFLICT(goal_hash) DO NOTHING"
+)
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+def _plan_writer():
+    while True:
+        batch = [_write_queue.get()]
+        try:
+            while len(batch) < _WRITE_BATCH_SIZE:
+                batch.append(_write_queue.get_nowait())
+        except queue.Empty:
+            pass
+        try:
+            conn = get_conn()
+            changes_before = conn.total_changes
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(INSERT_SQL, batch)
+            print(f"💾 {conn.total_changes - changes_before} plan(s) saved to database successfully!")
+        except Exception as e:
+            print(f"🔴 Database save error: {e}")
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+def queue_plan_save(rows):
+    # rows: (project_name, plan_json, goal_hash) tuples
+    global _writer_thread
+    with _writer_lock:
+        # Started lazily (and restarted after a fork) so each worker process has its own writer
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_plan_writer, name='plan-writer', daemon=True)
+            _writer_thread.start()
+    for row in rows:
+        _write_queue.put(row)
+
+# Flush plans that are still queued when the process shuts down
+atexit.register(_write_queue.join)
+
+# --- Plan cache ---
+# Generated plans are remembered by a hash of the normalized goal, first in an in-memory
+# LRU and then in the plans table, so repeated goals don't go back to the model.
+# Failed generations (e.g. quota errors) and DISABLE_AI dummy plans are never cached.
+# To force a fresh plan for a goal, see "Clearing cached plans" in the README.
+_PLAN_CACHE_SIZE = 1024
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+def goal_hash(goal):
+    normalized = ' '.join(goal.split()).casefold()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+def remember_plan(key, plan_json):
+    with _plan_cache_lock:
+        _plan_cache[key] = plan_json
+        _plan_cache.move_to_end(key)
+        if len(_plan_cache) > _PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+def lookup_cached_plan(key):
+    # Returns the stored plan JSON for this goal hash, or None on a miss
+    with _plan_cache_lock:
+        plan_json = _plan_cache.get(key)
+        if plan_json is not None:
+            _plan_cache.move_to_end(key)
+            return plan_json
+    row = get_conn().execute("SELECT plan_data FROM plans WHERE goal_hash = ?", (key,)).fetchone()
+    if row:
+        remember_plan(key, row['plan_data'])
+        return row['plan_data']
+    return None
+
+# Model calls spend almost all their time waiting on the network, so batch requests
+# run them on a shared thread pool to keep several in flight at once.
+_model_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='gemini')
+
 try:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    # gRPC keeps one persistent HTTP/2 channel per process that every request reuses
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"], transport='grpc')
     model = genai.GenerativeModel('models/gemini-pro-latest') 
 except KeyError:
     print("🔴 Error: GOOGLE_API_KEY not found. Please set it in the .env file.")
     exit()
 
+def warm_up_model():
+    # Opens the model connection (TLS handshake + channel setup) up front so the first
+    # user request doesn't pay for it. Must run in the serving process: a gRPC channel
+    # opened before a fork can't be used by the forked workers.
+    if _DISABLE_AI:
+        return
+    try:
+        model.count_tokens("warmup")
+    except Exception as e:
+        print(f"⚠️ Model warm-up failed: {e}")
+
 # --- Page Routes ---
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # --- NEW: Route to view all saved plans ---
+# Columns shown on the /plans listing. The task count is computed by SQLite's JSON1
+# functions so plan_data never has to be loaded and parsed in Python. plan_data is cast
+# to TEXT because newer SQLite versions read BLOB arguments as binary JSONB.
+_PLAN_LIST_COLUMNS = "id, project_name, created_at, json_array_length(CAST(plan_data AS TEXT), '$.tasks') AS task_count"
+
 @app.route('/plans')
 def view_plans():
-    conn = sqlite3.connect('plans.db')
-    # Use a dictionary cursor to get column names
-    conn.row_factory = sqlite3.Row 
-    cursor = conn.cursor()
-    # Fetch all plans, newest first
-    cursor.execute("SELECT id, project_name, created_at FROM plans ORDER BY created_at DESC")
+    # Keyset pagination: ?before=<created_at>&before_id=<id> continues after the last plan shown
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before = request.args.get('before')
+    before_id = request.args.get('before_id', type=int)
+    cursor = get_conn().cursor()
+    # Fetch one page of plans, newest first (id breaks ties between plans saved in the same second)
+    if before is None:
+        cursor.execute(
+            f"SELECT {_PLAN_LIST_COLUMNS} FROM plans ORDER BY created_at DESC, id DESC LIMIT ?",
+            (limit,)
+        )
+    else:
+        cursor.execute(
+            f"SELECT {_PLAN_LIST_COLUMNS} FROM plans"
+            " WHERE (created_at, id) < (?, ?)"
+            " ORDER BY created_at DESC, id DESC LIMIT ?",
+            (before, before_id if before_id is not None else -1, limit)
+        )
     plans = cursor.fetchall()
-    conn.close()
+    # A full page means there may be older plans to show
+    next_page = None
+    if len(plans) == limit:
+        last = plans[-1]
+        next_page = {'before': last['created_at'], 'before_id': last['id'], 'limit': limit}
     # Render a new HTML page to display the list of plans
-    return render_template('plans.html', plans=plans)
+    return render_template('plans.html', plans=plans, next_page=next_page)
+
+def is_quota_error(err_msg):
+    return 'quota' in err_msg.lower() or '429' in err_msg
+
+def quota_error_response(err_msg):
+    # HTTP 429, with a Retry-After header when the message says how long to wait
+    retry_after = None
+    m = _RETRY_RE.search(err_msg)
+    if m:
+        try:
+            retry_after = int(math.ceil(float(m.group(1) or m.group(2))))
+        except Exception:
+            retry_after = None
+
+    body = {"error": err_msg}
+    if retry_after is not None:
+        body['retry_after'] = retry_after
+        resp = make_response(jsonify(body), 429)
+        resp.headers['Retry-After'] = str(retry_after)
+        return resp
+    return jsonify(body), 429
 
 # --- API Endpoints ---
 @app.route('/create-plan', methods=['POST'])
@@ -64,77 +276,116 @@ def create_plan_endpoint():
         return jsonify({"error": "Missing JSON in request"}), 400
     
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "The request body must be a JSON object."}), 400
     goal = data.get('goal')
 
-    if not goal:
+    if not goal or not isinstance(goal, str):
         return jsonify({"error": "The 'goal' field is required."}), 400
+
+    if len(goal) > MAX_GOAL_LENGTH:
+        return jsonify({"error": f"The 'goal' field must be at most {MAX_GOAL_LENGTH} characters."}), 413
     
     print(f"🚀 Received goal: {goal}")
-    plan = generate_plan(goal)
+    # Dummy plans are saved without a goal hash so they never shadow real ones later
+    key = None if _DISABLE_AI else goal_hash(goal)
+    cached = lookup_cached_plan(key) if key is not None else None
+    if cached is not None:
+        print("⚡ Returning cached plan for this goal")
+        return Response(cached, mimetype='application/json')
+
+    plan, plan_json = generate_plan(goal)
     
     if "error" in plan:
         # Map certain known errors to HTTP status codes
         err_msg = str(plan.get('error', ''))
-        if 'quota' in err_msg.lower() or '429' in err_msg:
-            # Try to extract a retry delay in seconds from common message patterns
-            retry_after = None
-            m = re.search(r'Please retry in\s*(\d+(?:\.\d+)?)s', err_msg, flags=re.IGNORECASE)
-            if not m:
-                m = re.search(r'retry_delay\s*\{[^}]*seconds:\s*(\d+)', err_msg)
-            if m:
-                try:
-                    retry_after = int(math.ceil(float(m.group(1))))
-                except Exception:
-                    retry_after = None
-
-            # Build response with Retry-After header when available
-            from flask import make_response
-            body = {"error": err_msg}
-            if retry_after is not None:
-                body['retry_after'] = retry_after
-                resp = make_response(jsonify(body), 429)
-                resp.headers['Retry-After'] = str(retry_after)
-                return resp
-            return jsonify(body), 429
+        if is_quota_error(err_msg):
+            return quota_error_response(err_msg)
         # Generic server error
         return jsonify({"error": err_msg}), 500
     
-    # --- NEW: Save the successful plan to the database ---
-    try:
-        conn = sqlite3.connect('plans.db')
-        cursor = conn.cursor()
-        # Convert the plan dictionary to a JSON string for storage
-        plan_json_string = json.dumps(plan)
-        cursor.execute(
-            "INSERT INTO plans (project_name, plan_data) VALUES (?, ?)",
-            (plan.get('project_name', 'Untitled Plan'), plan_json_string)
-        )
-        conn.commit()
-        conn.close()
-        print("💾 Plan saved to database successfully!")
-    except Exception as e:
-        print(f"🔴 Database save error: {e}")
+    if key is not None:
+        remember_plan(key, plan_json)
+
+    # --- NEW: Save the successful plan to the database (in the background) ---
+    queue_plan_save([(plan.get('project_name') or 'Untitled Plan', plan_json, key)])
 
     print("✅ Plan generated successfully!")
-    return jsonify(plan)
+    return Response(plan_json, mimetype='application/json')
+
+# --- Batch endpoint: generate several plans and save them together ---
+@app.route('/create-plans', methods=['POST'])
+def create_plans_endpoint():
+    if not request.is_json:
+        return jsonify({"error": "Missing JSON in request"}), 400
+
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "The request body must be a JSON object."}), 400
+    goals = data.get('goals')
+
+    if not isinstance(goals, list) or not goals or not all(isinstance(g, str) and g for g in goals):
+        return jsonify({"error": "The 'goals' field must be a non-empty list of goal strings."}), 400
+
+    if len(goals) > MAX_BATCH_GOALS:
+        return jsonify({"error": f"At most {MAX_BATCH_GOALS} goals can be submitted at once."}), 413
+
+    if any(len(g) > MAX_GOAL_LENGTH for g in goals):
+        return jsonify({"error": f"Each goal must be at most {MAX_GOAL_LENGTH} characters."}), 413
+
+    print(f"🚀 Received {len(goals)} goals")
+    plans = [None] * len(goals)
+    # goal hash -> (goal, positions in the request); repeated goals are only generated once
+    pending = {}
+    for i, goal in enumerate(goals):
+        key = goal_hash(goal)
+        if key in pending:
+            pending[key][1].append(i)
+            continue
+        cached = lookup_cached_plan(key) if not _DISABLE_AI else None
+        if cached is not None:
+            plans[i] = orjson.loads(cached)
+            continue
+        pending[key] = (goal, [i])
+
+    rows = []
+    keys = list(pending)
+    generated = _model_executor.map(generate_plan, [pending[key][0] for key in keys])
+    for key, (plan, plan_json) in zip(keys, generated):
+        for i in pending[key][1]:
+            plans[i] = plan
+        if "error" not in plan:
+            if _DISABLE_AI:
+                # Dummy plans are saved without a goal hash so they never shadow real ones later
+                key = None
+            else:
+                remember_plan(key, plan_json)
+            rows.append((plan.get('project_name') or 'Untitled Plan', plan_json, key))
+
+    # Queued together so the writer commits them in as few transactions as possible
+    if rows:
+        queue_plan_save(rows)
+
+    # Same status as /create-plan when nothing could be generated because of the quota
+    errors = [str(plan['error']) for plan in plans if "error" in plan]
+    if len(errors) == len(plans) and all(is_quota_error(e) for e in errors):
+        return quota_error_response(errors[0])
+
+    return jsonify({"plans": plans})
 
 # --- NEW: API endpoint to get a single saved plan ---
 @app.route('/plans/<int:plan_id>')
 def get_plan(plan_id):
-    conn = sqlite3.connect('plans.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    cursor = get_conn().cursor()
     cursor.execute("SELECT plan_data FROM plans WHERE id = ?", (plan_id,))
     plan_record = cursor.fetchone()
-    conn.close()
     if plan_record:
-        # The data is stored as a string, so we parse it back into JSON
-        plan_data = json.loads(plan_record['plan_data'])
-        return jsonify(plan_data)
+        # The data is already stored as JSON (validated on insert), so send it as-is
+        return Response(plan_record['plan_data'], mimetype='application/json')
     return jsonify({"error": "Plan not found"}), 404
 
-def generate_plan(goal):
-    prompt = f"""
+# Prompt sent to the model; only {goal} is filled in per request
+_PROMPT_TEMPLATE = """
     Break down the following goal into a detailed plan.
     The goal is: "{goal}"
 
@@ -143,59 +394,80 @@ def generate_plan(goal):
     Each task object must have these keys: "task_id", "task_name", "description", "timeline_days", and "dependencies".
     "dependencies" must be a list of "task_id"s. If there are no dependencies, it must be an empty list [].
     """
+
+def generate_plan(goal):
+    # Returns (plan, plan_json): the parsed plan dict and its JSON encoded as UTF-8 bytes.
+    # plan_json is the model's own JSON text, kept so it can be stored and served without
+    # serializing the dict again. On failure plan is {"error": ...} and plan_json is None.
+    prompt = _PROMPT_TEMPLATE.format_map({'goal': goal})
     
-    # Local testing fallback: set DISABLE_AI=1 (or true) in your environment to avoid calling the external API
-    if os.environ.get('DISABLE_AI', '').lower() in ('1', 'true', 'yes'):
+    if _DISABLE_AI:
         print('⚠️ DISABLE_AI is set — returning a local dummy plan for testing.')
-        return {
+        plan = {
             "project_name": "Local Test Plan",
             "tasks": [
                 {"task_id": 1, "task_name": "Test task", "description": goal, "timeline_days": 1, "dependencies": []}
             ]
         }
+        return plan, orjson.dumps(plan)
 
     try:
         response = model.generate_content(prompt)
-        # Log the raw response for debugging when parsing fails
         raw_text = getattr(response, 'text', None)
-        print(f"🔎 Raw model response:\n{raw_text}")
+        if raw_text and len(raw_text) > MAX_RESPONSE_LENGTH:
+            raw_text = raw_text[:MAX_RESPONSE_LENGTH]
+        # Raw responses are only logged on request; parse failures are still saved to a file below
+        if _LOG_RAW:
+            app.logger.debug("🔎 Raw model response:\n%s", raw_text)
 
         # Try to clean up common prefixes/suffixes the model might include
         json_response_text = (raw_text or '').strip()
 
         # Remove common Markdown code fences (```json or ```)
-        json_response_text = re.sub(r"^```(?:json)?\s*", '', json_response_text, flags=re.IGNORECASE)
-        json_response_text = re.sub(r"\s*```$", '', json_response_text)
+        json_response_text = _FENCE_PREFIX_RE.sub('', json_response_text)
+        # (plain string ops for the closing fence: a trailing-whitespace regex is quadratic on long runs)
+        if json_response_text.endswith('```'):
+            json_response_text = json_response_text[:-3].rstrip()
 
         # Remove a leading 'json' or 'JSON' token if present
         if json_response_text.lower().startswith('json'):
             json_response_text = json_response_text[len('json'):].strip()
 
-        # If the model included surrounding text, try to extract the first JSON object/braced block
-        json_match = re.search(r"\{[\s\S]*\}", json_response_text)
-        if json_match:
-            json_candidate = json_match.group(0).strip()
+        # If the model included surrounding text, try to extract the outermost JSON object/braced block
+        # by slicing from the first '{' to the last '}'
+        start, end = json_response_text.find('{'), json_response_text.rfind('}')
+        if start != -1 and end > start:
+            json_candidate = json_response_text[start:end + 1]
         else:
             json_candidate = json_response_text
 
         try:
-            plan = json.loads(json_candidate)
-            return plan
-        except json.JSONDecodeError as jde:
+            plan = orjson.loads(json_candidate)
+        except orjson.JSONDecodeError as jde:
             print(f"🔴 JSON decode error: {jde}")
-            # Save the raw text to a file to help debugging (low risk)
-            try:
-                with open('last_raw_model_response.txt', 'w', encoding='utf-8') as f:
-                    f.write(raw_text or '')
-            except Exception:
-                pass
-            return {"error": "AI returned invalid JSON. See server logs or last_raw_model_response.txt for details."}
+            plan = None
+        else:
+            if isinstance(plan, dict):
+                # The candidate parsed cleanly, so it can be stored as the canonical JSON as-is
+                return plan, json_candidate.encode('utf-8')
+            print(f"🔴 JSON decode error: expected an object, got {type(plan).__name__}")
+
+        # Save the raw text to a file to help debugging (low risk)
+        try:
+            with open('last_raw_model_response.txt', 'w', encoding='utf-8') as f:
+                f.write(raw_text or '')
+        except Exception:
+            pass
+        return {"error": "AI returned invalid JSON. See server logs or last_raw_model_response.txt for details."}, None
     except Exception as e:
         # Propagate the exception message (useful for returning 429/quota messages to the client)
         print(f"🔴 An error occurred calling the model: {e}")
-        return {"error": str(e)}
+        return {"error": str(e)}, None
+
+# Initialize the database when the app is loaded (also under gunicorn, which never runs __main__)
+init_db()
 
-# Initialize the database when the app starts
+# Local development server; use gunicorn (see gunicorn.conf.py) in production
 if __name__ == '__main__':
-    init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    warm_up_model()
+    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
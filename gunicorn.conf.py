@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# Production server settings. Run with:  gunicorn app:app
+# (gunicorn picks this file up automatically from the working directory)
+
+bind = "0.0.0.0:5000"
+
+# Model calls are network-bound, so each worker runs many threads to keep
+# several requests in flight at once.
+workers = 4
+threads = 16
+worker_class = "gthread"
+
+# Import app.py once in the master process (database setup, compiled regexes,
+# model client) before forking the workers.
+preload_app = True
+
+
+def post_worker_init(worker):
+    # The model connection is opened per worker, after the fork (see warm_up_model).
+    # It runs in a background thread so a slow or unreachable API can't hold up worker
+    # startup past its first heartbeat and get the worker killed.
+    import threading
+    from app import warm_up_model
+    threading.Thread(target=warm_up_model, name='model-warmup', daemon=True).start()
+
@@ -4,8 +4,11 @@ Simple helper to inspect plans.db
 Usage:
     python scripts\inspect_db.py list
     python scripts\inspect_db.py show <id>
+    python scripts\inspect_db.py repl
 
 Prints a list of saved plans or JSON data for a single plan id.
+`repl` keeps one connection open and reads `list` / `show <id>` / `quit`
+commands from stdin, which is much cheaper for many lookups in a row.
 """
 import sqlite3
 import json
@@ -15,16 +18,20 @@ from pathlib import Path
 DB_PATH = Path(__file__).resolve().parents[1] / 'plans.db'
 
 
-def list_plans(limit=50):
+def connect():
     if not DB_PATH.exists():
         print(f"No database found at {DB_PATH}")
-        return
-    conn = sqlite3.connect(DB_PATH)
+        return None
+    # Read-only use, so autocommit mode avoids opening implicit transactions
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    return conn
+
+
+def list_plans(conn, limit=50):
     cursor = conn.cursor()
     cursor.execute("SELECT id, project_name, created_at FROM plans ORDER BY created_at DESC LIMIT ?", (limit,))
     rows = cursor.fetchall()
-    conn.close()
     if not rows:
         print("No plans saved yet.")
         return
@@ -32,16 +39,10 @@ def list_plans(limit=50):
         print(f"{r['id']:>4} | {r['created_at']} | {r['project_name']}")
 
 
-def show_plan(plan_id):
-    if not DB_PATH.exists():
-        print(f"No database found at {DB_PATH}")
-        return
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+def show_plan(conn, plan_id):
     cursor = conn.cursor()
     cursor.execute("SELECT plan_data FROM plans WHERE id = ?", (plan_id,))
     row = cursor.fetchone()
-    conn.close()
     if not row:
         print(f"Plan with id {plan_id} not found.")
         return
@@ -51,7 +52,30 @@ def show_plan(plan_id):
     except Exception as e:
         print(f"Failed to parse plan JSON: {e}")
         print("Raw data:\n")
-        print(row['plan_data'])
+        raw = row['plan_data']
+        # Plans are stored as JSON bytes; only decode here for display
+        print(raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw)
+
+
+def repl(conn):
+    # The same connection (and sqlite3's cached prepared statements) is reused for every command
+    while True:
+        try:
+            line = input('> ').strip()
+        except EOFError:
+            break
+        if not line:
+            continue
+        cmd, *args = line.split()
+        cmd = cmd.lower()
+        if cmd in ('quit', 'exit'):
+            break
+        elif cmd == 'list':
+            list_plans(conn)
+        elif cmd == 'show' and len(args) == 1:
+            show_plan(conn, args[0])
+        else:
+            print("Commands: list | show <id> | quit")
 
 
 if __name__ == '__main__':
@@ -59,10 +83,18 @@ if __name__ == '__main__':
         print(__doc__)
         sys.exit(1)
     cmd = sys.argv[1].lower()
-    if cmd == 'list':
-        list_plans()
-    elif cmd == 'show' and len(sys.argv) == 3:
-        show_plan(sys.argv[2])
-    else:
+    if cmd not in ('list', 'show', 'repl') or (cmd == 'show' and len(sys.argv) != 3):
         print(__doc__)
         sys.exit(1)
+    conn = connect()
+    if conn is None:
+        sys.exit(0)
+    try:
+        if cmd == 'list':
+            list_plans(conn)
+        elif cmd == 'show':
+            show_plan(conn, sys.argv[2])
+        else:
+            repl(conn)
+    finally:
+        conn.close()